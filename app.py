@@ -1,22 +1,80 @@
+import atexit
+import random
+import time
+import httpx
 import streamlit as st
-from supabase import create_client
+from functools import lru_cache
+from postgrest import APIError
+from supabase import ClientOptions, create_client
 from decimal import Decimal
 from datetime import date
 
+# Мора да биде прва Streamlit команда (st.cache_resource подолу прикажува spinner)
+st.set_page_config(page_title="Менаџер за муштерии и долгови", layout="wide")
+
 # --- Конфигурација ---
 URL = st.secrets["SUPABASE_URL"]
 KEY = st.secrets["SUPABASE_ANON_KEY"]
-sb = create_client(URL, KEY)
+PAGE = 25  # муштерии по страна во листата
+RETRIES = 4  # обиди по барање кога Supabase враќа 429 Too Many Requests
+RETRY_MAX_WAIT = 2.0  # најмногу секунди чекање по обид, и кога Retry-After е подолг
 
-st.set_page_config(page_title="Менаџер за муштерии и долгови", layout="wide")
+class RetryTransport(httpx.HTTPTransport):
+    # 429 значи дека барањето не е обработено, па е безбедно да се прати повторно
+    # (и за insert); се чека Retry-After или експоненцијално со мал случаен додаток.
+    def handle_request(self, request):
+        for attempt in range(RETRIES):
+            response = super().handle_request(request)
+            if response.status_code != 429 or attempt == RETRIES - 1:
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            response.close()
+            delay = min(float(retry_after), RETRY_MAX_WAIT) if retry_after.isdigit() else 0.1 * 2 ** attempt
+            time.sleep(delay + random.random() * 0.05)
+
+@st.cache_resource
+def get_http():
+    # Едно HTTP/2 keep-alive поврзување за сите повици, без нов TLS handshake по барање
+    client = httpx.Client(
+        # Клиентот е заеднички за сите сесии; поврзувањата остануваат отворени и меѓу кликовите
+        transport=RetryTransport(
+            http2=True,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=30),
+        ),
+        timeout=10,
+        follow_redirects=True,
+    )
+    atexit.register(client.close)
+    return client
+
+@st.cache_resource
+def get_sb():
+    # Клиентот се прави еднаш по процес, не при секое повторно извршување на скриптата
+    return create_client(URL, KEY, options=ClientOptions(httpx_client=get_http()))
+
+sb = get_sb()
 
 # --- Helpers ---
+ZERO = Decimal("0")
+
 def dec(x):
+    # Decimal и int без заобиколување преку str(); float мора преку str(),
+    # инаку Decimal(0.1) ја носи бинарната грешка (0.1000000000000000055...)
+    if isinstance(x, Decimal):
+        return x
+    if isinstance(x, int):
+        return Decimal(x)
+    return _dec(str(x))
+
+# Износите се повторуваат (чекор 100), па парсирањето и форматирањето се кешираат
+@lru_cache(maxsize=4096)
+def _dec(s: str) -> Decimal:
     try:
-        return Decimal(str(x))
+        return Decimal(s)
     except Exception:
-        return Decimal("0")
+        return ZERO
 
+@lru_cache(maxsize=4096)
 def fmt_money(d: Decimal) -> str:
     # убаво прикажување без .00 кога е цел број
     if d == d.to_integral_value():
@@ -24,76 +82,206 @@ def fmt_money(d: Decimal) -> str:
     return f"{d:.2f} ден."
 
 # --- Customers ---
-def fetch_customers(q: str = ""):
-    q = (q or "").strip()
-    if not q:
-        res = sb.table("customers").select("*").order("created_at", desc=True).execute()
-    else:
-        res = sb.table("customers").select("*").ilike("name", f"%{q}%").execute()
-    return res.data if res.data else []
+# Листата се кешира по пребарување и страна; секое запишување ја брише цела (салдото е во секој ред)
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_customers(q: str = "", page: int = 1):
+    # Преостанатото (balance) го одржува базата со тригери — еден повик по страна.
+    # Враќа (муштерии на страната, вкупно пронајдени).
+    params = {"q": (q or "").strip()}
+    start = (page - 1) * PAGE
+    try:
+        res = (
+            sb.rpc("list_customers_with_balance", params, count="exact")
+            .select("id,name,phone,initial_debt,balance,created_at")
+            .range(start, start + PAGE - 1)
+            .execute()
+        )
+    except APIError as e:
+        # Страна по крајот: PostgREST враќа 416 (PGRST103), па се бара само вкупниот број
+        if e.code != "PGRST103":
+            raise
+        res = sb.rpc("list_customers_with_balance", params, count="exact", head=True).execute()
+        return [], (res.count or 0)
+    return (res.data if res.data else []), (res.count or 0)
+
+# Читањата по муштерија се кешираат; секое запишување ги брише само записите за таа муштерија
+@st.cache_data(ttl=30, show_spinner=False)
+def fetch_customer(cid):
+    # Муштеријата и нејзините уплати во еден повик (вгнездени преку payments.customer_id).
+    # maybe_single: објект наместо листа, а None ако муштеријата е избришана
+    res = (
+        sb.table("customers")
+        .select("*,payments(pay_date,amount,note)")
+        .eq("id", cid)
+        .order("pay_date", desc=True, foreign_table="payments")
+        .maybe_single()
+        .execute()
+    )
+    return res.data if res else None
 
 def insert_customer(name, phone, note, initial_debt):
-    return sb.table("customers").insert({
+    res = sb.table("customers").insert({
         "name": (name or "").strip(),
         "phone": (phone or "").strip(),
         "note": (note or "").strip(),
         # ВАЖНО: праќаме float, не Decimal
         "initial_debt": float(initial_debt) if initial_debt is not None else 0.0
     }).execute()
+    fetch_customers.clear()
+    return res
 
 def update_customer(cid, name, phone, note, initial_debt):
-    return sb.table("customers").update({
+    res = sb.table("customers").update({
         "name": (name or "").strip(),
         "phone": (phone or "").strip(),
         "note": (note or "").strip(),
         # ВАЖНО: праќаме float, не Decimal
         "initial_debt": float(initial_debt) if initial_debt is not None else 0.0
     }).eq("id", cid).execute()
+    fetch_customers.clear()
+    fetch_customer.clear(cid)
+    return res
 
 def delete_customer(cid):
-    return sb.table("customers").delete().eq("id", cid).execute()
+    res = sb.table("customers").delete().eq("id", cid).execute()
+    fetch_customers.clear()
+    fetch_customer.clear(cid)
+    return res
 
 # --- Payments ---
-def fetch_payments(customer_id):
-    res = sb.table("payments").select("*").eq("customer_id", customer_id).order("pay_date", desc=True).execute()
-    return res.data if res.data else []
-
-def add_payment(customer_id, amount, pay_date, note):
-    return sb.table("payments").insert({
+def _payment_row(customer_id, amount, pay_date, note):
+    return {
         "customer_id": customer_id,
         # ВАЖНО: праќаме float, не Decimal
         "amount": float(amount) if amount is not None else 0.0,
         "pay_date": str(pay_date),
         "note": (note or "").strip()
-    }).execute()
+    }
+
+def add_payments(rows):
+    # Сите ставки во еден POST — PostgREST ја внесува целата листа одеднаш
+    if not rows:
+        return None
+    res = sb.table("payments").insert([_payment_row(**r) for r in rows]).execute()
+    fetch_customers.clear()
+    for customer_id in {r["customer_id"] for r in rows}:
+        fetch_customer.clear(customer_id)
+    return res
 
 # --- UI ---
+def flash(kind, msg):
+    # st.rerun() ги брише тековните пораки, па пораката се прикажува во следното извршување
+    st.session_state["flash"] = (kind, msg)
+    st.rerun()
+
 st.title("📒 Менаџер за муштерии и долгови")
+if "flash" in st.session_state:
+    kind, msg = st.session_state.pop("flash")
+    getattr(st, kind)(msg)
 
 menu = st.sidebar.radio("Менито:", ["Листа", "Додај муштерија"])
 
-if menu == "Листа":
-    q = st.text_input("🔍 Пребарај муштерии (име/телефон)")
-    customers = fetch_customers(q)
+# Листата и деталите се фрагменти: интеракција во едниот не го извршува другиот повторно
+@st.fragment
+def list_view():
+    # Пребарувањето се праќа со копчето (или Enter), не при секоја промена во полето
+    with st.form("search", clear_on_submit=False, border=False):
+        q = st.text_input("🔍 Пребарај муштерии (име/телефон)")
+        if st.form_submit_button("Барај"):
+            st.session_state["list_page"] = 1
+    page = st.number_input("Страна", min_value=1, step=1, key="list_page")
+    customers, total = fetch_customers(q, int(page))
+    pages = (total + PAGE - 1) // PAGE
 
-    if not customers:
+    if not customers and total:
+        st.info(f"Нема муштерии на страна {page} (вкупно страни: {pages}).")
+    elif not customers:
         st.info("❌ Нема пронајдени муштерии.")
     else:
-        for c in customers:
-            col1, col2, col3, col4 = st.columns([3, 2, 2, 2])
-            with col1:
-                st.write(f"**{c['name']}**")
-                st.caption(c.get("phone") or "")
-            with col2:
-                st.write("📌 Почетен долг:", fmt_money(dec(c.get("initial_debt") or 0)))
-            with col3:
-                pays = fetch_payments(c["id"])
-                total = dec(c.get("initial_debt") or 0) + sum([dec(p["amount"]) for p in pays])
-                st.write("💰 Преостанато:", fmt_money(total))
-            with col4:
-                if st.button("📂 Детали", key=f"det-{c['id']}"):
-                    st.session_state["view_customer"] = c["id"]
+        st.caption(f"Страна {page} од {pages} · вкупно {total} муштерии · избери ред за детали")
+        # Една табела наместо колони и копче „Детали“ за секој ред
+        event = st.dataframe(
+            [{
+                "Име": c["name"],
+                "Телефон": c.get("phone") or "",
+                "📌 Почетен долг": float(dec(c.get("initial_debt") or 0)),
+                "💰 Преостанато": float(dec(c.get("balance") or 0)),
+            } for c in customers],
+            # Бројки (не текст), за сортирањето по колона да биде нумеричко
+            column_config={
+                "📌 Почетен долг": st.column_config.NumberColumn(format="%.2f ден."),
+                "💰 Преостанато": st.column_config.NumberColumn(format="%.2f ден."),
+            },
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            # Нов клуч за секој нов сет редови, за старата селекција да не покаже друга муштерија
+            key=f"customers-{hash(tuple(c['id'] for c in customers))}",
+        )
+        rows = event.selection.rows
+        if rows and customers[rows[0]]["id"] != st.session_state.get("view_customer"):
+            st.session_state["view_customer"] = customers[rows[0]]["id"]
+            st.rerun()
+
+@st.fragment
+def detail_view(cid):
+    # Листата не ја носи белешката, па целиот запис (со уплатите) доаѓа од кешираниот fetch_customer
+    cust = fetch_customer(cid)
+    if not cust:
+        st.warning("Муштеријата не постои.")
+        return
 
+    st.header(f"📌 Детали: {cust['name']}")
+
+    # Основни податоци
+    with st.expander("Основни податоци", expanded=True):
+        new_name = st.text_input("Име и презиме", value=cust["name"])
+        new_phone = st.text_input("Телефон", value=cust.get("phone") or "")
+        new_note = st.text_area("Белешка", value=cust.get("note") or "")
+        new_debt = st.number_input("Почетен долг", value=float(cust.get("initial_debt") or 0), step=100.0)
+        c1, c2 = st.columns(2)
+        if c1.button("💾 Зачувај промени"):
+            update_customer(cid, new_name, new_phone, new_note, dec(new_debt))
+            flash("success", "✅ Промените се зачувани!")
+        if c2.button("🗑️ Избриши муштерија"):
+            delete_customer(cid)
+            st.session_state.pop("view_customer")
+            st.session_state.get("pending_pays", {}).pop(cid, None)
+            flash("warning", "❌ Муштеријата е избришана!")
+
+    # Уплати / нов долг
+    st.subheader("💵 Уплати / Нов долг")
+    pay_date = st.date_input("Датум", value=date.today())
+    amount = st.number_input("Износ (уплата=+, нов долг=-)", step=100.0, format="%.2f")
+    note_pay = st.text_input("Белешка (опц.)")
+    # Ставките се собираат локално и се зачувуваат заедно, со еден повик до базата
+    pending = st.session_state.setdefault("pending_pays", {}).setdefault(cid, [])
+    b1, b2, b3 = st.columns(3)
+    if b1.button("➕ Додај ставка"):
+        pending.append({"customer_id": cid, "amount": dec(amount), "pay_date": pay_date, "note": note_pay})
+    if pending:
+        st.write("🕒 Незачувани ставки")
+        for r in pending:
+            st.write(f"{r['pay_date']} | {fmt_money(r['amount'])} | {(r['note'] or '').strip()}")
+        if b2.button(f"💾 Зачувај ставки ({len(pending)})"):
+            add_payments(pending)
+            st.session_state["pending_pays"].pop(cid)
+            flash("success", "✅ Ставките се додадени!")
+        if b3.button("✖️ Откажи ставки"):
+            st.session_state["pending_pays"].pop(cid)
+            st.rerun(scope="fragment")
+
+    # Историја
+    pays = cust.get("payments") or []
+    if pays:
+        st.write("📜 Историја на уплати/долгови")
+        for p in pays:
+            st.write(f"{p['pay_date']} | {fmt_money(dec(p['amount']))} | {p.get('note') or ''}")
+    else:
+        st.info("Нема уплати/долгови за овој клиент.")
+
+if menu == "Листа":
+    list_view()
 
 elif menu == "Додај муштерија":
     st.subheader("➕ Нова муштерија")
@@ -110,43 +298,4 @@ elif menu == "Додај муштерија":
 
 # --- Детален приказ ---
 if "view_customer" in st.session_state:
-    cid = st.session_state["view_customer"]
-    rec = sb.table("customers").select("*").eq("id", cid).execute().data
-    if not rec:
-        st.warning("Муштеријата не постои.")
-    else:
-        cust = rec[0]
-        st.header(f"📌 Детали: {cust['name']}")
-
-        # Основни податоци
-        with st.expander("Основни податоци", expanded=True):
-            new_name = st.text_input("Име и презиме", value=cust["name"])
-            new_phone = st.text_input("Телефон", value=cust.get("phone") or "")
-            new_note = st.text_area("Белешка", value=cust.get("note") or "")
-            new_debt = st.number_input("Почетен долг", value=float(cust.get("initial_debt") or 0), step=100.0)
-            c1, c2 = st.columns(2)
-            if c1.button("💾 Зачувај промени"):
-                update_customer(cid, new_name, new_phone, new_note, dec(new_debt))
-                st.success("✅ Промените се зачувани!")
-            if c2.button("🗑️ Избриши муштерија"):
-                delete_customer(cid)
-                st.session_state.pop("view_customer")
-                st.warning("❌ Муштеријата е избришана!")
-
-        # Уплати / нов долг
-        st.subheader("💵 Уплати / Нов долг")
-        pay_date = st.date_input("Датум", value=date.today())
-        amount = st.number_input("Износ (уплата=+, нов долг=-)", step=100.0, format="%.2f")
-        note_pay = st.text_input("Белешка (опц.)")
-        if st.button("➕ Додај ставка"):
-            add_payment(cid, dec(amount), pay_date, note_pay)
-            st.success("✅ Ставката е додадена!")
-
-        # Историја
-        pays = fetch_payments(cid)
-        if pays:
-            st.write("📜 Историја на уплати/долгови")
-            for p in pays:
-                st.write(f"{p['pay_date']} | {fmt_money(dec(p['amount']))} | {p.get('note') or ''}")
-        else:
-            st.info("Нема уплати/долгови за овој клиент.")
+    detail_view(st.session_state["view_customer"])
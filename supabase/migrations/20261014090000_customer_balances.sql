@@ -0,0 +1,23 @@
+-- Салдо по муштерија пресметано во базата.
+-- Листата ги добива сите муштерии со преостанатиот долг во еден повик,
+-- наместо по едно барање за уплати за секој ред.
+
+create or replace view public.customer_balances
+with (security_invoker = true) as
+select c.*,
+       c.initial_debt + coalesce(sum(p.amount), 0) as remaining
+from public.customers c
+left join public.payments p on p.customer_id = c.id
+group by c.id;
+
+create or replace function public.list_customers_with_balance(q text default '')
+returns setof public.customer_balances
+language sql
+stable
+as $$
+  select *
+  from public.customer_balances
+  where coalesce(trim(q), '') = ''
+     or name ilike '%' || trim(q) || '%'
+  order by created_at desc
+$$;
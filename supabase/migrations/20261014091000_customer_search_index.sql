@@ -0,0 +1,47 @@
+-- Пребарување по име/телефон преку GIN индекс наместо ilike '%q%' (секвенцијално читање).
+
+create index if not exists customers_search_gin
+    on public.customers
+    using gin (to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(phone, '')));
+
+-- Секој збор од q се бара како префикс ("Алек Јан" -> 'алек':* & 'јан':*),
+-- за пребарувањето да работи и додека се пишува.
+create or replace function public.customer_search_query(q text)
+returns tsquery
+language sql
+immutable
+as $$
+  select case
+    when plainto_tsquery('simple', q)::text = '' then null
+    else regexp_replace(plainto_tsquery('simple', q)::text, '''( |$)', ''':*\1', 'g')::tsquery
+  end
+$$;
+
+-- Салдото по ред наместо group by, за филтерот по муштерија да се примени пред сумирањето.
+create or replace view public.customer_balances
+with (security_invoker = true) as
+select c.*,
+       c.initial_debt + coalesce(
+         (select sum(p.amount) from public.payments p where p.customer_id = c.id), 0
+       ) as remaining
+from public.customers c;
+
+create or replace function public.list_customers_with_balance(q text default '')
+returns setof public.customer_balances
+language plpgsql
+stable
+as $$
+begin
+  if coalesce(trim(q), '') = '' then
+    return query
+      select * from public.customer_balances
+      order by created_at desc;
+  else
+    return query
+      select * from public.customer_balances b
+      where to_tsvector('simple', coalesce(b.name, '') || ' ' || coalesce(b.phone, ''))
+            @@ public.customer_search_query(q)
+      order by b.created_at desc;
+  end if;
+end;
+$$;
@@ -0,0 +1,4 @@
+-- Уплатите се читаат секогаш по муштерија и подредени по датум
+-- (историјата во деталите и сумата во customer_balances).
+create index if not exists payments_customer_pay_date
+    on public.payments (customer_id, pay_date);
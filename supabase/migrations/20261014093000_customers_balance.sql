@@ -0,0 +1,73 @@
+-- Салдото се чува во customers.balance и се одржува со тригери при секое запишување,
+-- па листата е обично читање од customers без сумирање на уплатите.
+
+alter table public.customers
+    add column if not exists balance numeric not null default 0;
+
+update public.customers c
+set balance = coalesce(c.initial_debt, 0)
+            + coalesce((select sum(p.amount) from public.payments p where p.customer_id = c.id), 0);
+
+-- Почетниот долг влегува во салдото; при промена се додава само разликата.
+create or replace function public.customers_set_balance()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    new.balance := coalesce(new.initial_debt, 0);
+  else
+    new.balance := old.balance - coalesce(old.initial_debt, 0) + coalesce(new.initial_debt, 0);
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists customers_balance on public.customers;
+create trigger customers_balance
+    before insert or update of initial_debt on public.customers
+    for each row execute function public.customers_set_balance();
+
+create or replace function public.payments_apply_balance()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op in ('UPDATE', 'DELETE') then
+    update public.customers set balance = balance - old.amount where id = old.customer_id;
+  end if;
+  if tg_op in ('INSERT', 'UPDATE') then
+    update public.customers set balance = balance + new.amount where id = new.customer_id;
+  end if;
+  return null;
+end;
+$$;
+
+drop trigger if exists payments_balance on public.payments;
+create trigger payments_balance
+    after insert or update or delete on public.payments
+    for each row execute function public.payments_apply_balance();
+
+-- Прегледот со агрегација повеќе не е потребен.
+drop function if exists public.list_customers_with_balance(text);
+drop view if exists public.customer_balances;
+
+create function public.list_customers_with_balance(q text default '')
+returns setof public.customers
+language plpgsql
+stable
+as $$
+begin
+  if coalesce(trim(q), '') = '' then
+    return query
+      select * from public.customers
+      order by created_at desc;
+  else
+    return query
+      select * from public.customers c
+      where to_tsvector('simple', coalesce(c.name, '') || ' ' || coalesce(c.phone, ''))
+            @@ public.customer_search_query(q)
+      order by c.created_at desc;
+  end if;
+end;
+$$;
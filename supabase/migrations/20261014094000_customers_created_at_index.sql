@@ -0,0 +1,3 @@
+-- Листата е подредена по created_at desc и се чита по страни (limit/offset).
+create index if not exists customers_created_at
+    on public.customers (created_at desc);
@@ -0,0 +1,16 @@
+-- plpgsql функција не може да се вметне во повикот, па limit/offset од
+-- PostgREST стои над Function Scan и индексот customers_created_at не се
+-- користи. Како еден SQL select (stable) планерот ја вметнува во барањето:
+-- за празно q условот отпаѓа и страната се чита од customers_created_at, а
+-- за пребарување останува само FTS условот врз customers_search_gin.
+create or replace function public.list_customers_with_balance(q text default '')
+returns setof public.customers
+language sql
+stable
+as $$
+  select * from public.customers c
+  where coalesce(trim(q), '') = ''
+     or to_tsvector('simple', coalesce(c.name, '') || ' ' || coalesce(c.phone, ''))
+        @@ public.customer_search_query(q)
+  order by c.created_at desc;
+$$;